@@ -1,19 +1,31 @@
 import os
+import sys
+import argparse
 from pathlib import Path
-import time
-import requests
+import asyncio
+import aiohttp
 from runwayml import RunwayML
 import logging
-import base64
+from log_setup import setup_queue_logging
+from image_cache import image_data_url_cached
+from uring_writer import URING_AVAILABLE, UringFileWriter
+
+# asyncio.timeout replaced async_timeout in Python 3.11
+if sys.version_info >= (3, 11):
+    from asyncio import timeout
+else:
+    from async_timeout import timeout
 
 class SimpleVideoGenerator:
-    def __init__(self, input_prompt_folder: str, output_video_folder: str):
+    def __init__(self, input_prompt_folder: str, output_video_folder: str, use_uring: bool = False, force: bool = False):
         """
         Initialize the Runway video generator with simplified client.
         
         Args:
             input_prompt_folder (str): Folder containing generated prompts
             output_video_folder (str): Folder to save generated videos
+            use_uring (bool): Write downloads through io_uring when liburing is installed
+            force (bool): Regenerate videos that already exist in the output folder
         """
         self.runway_key = os.getenv('RUNWAY_API_KEY')
         if not self.runway_key:
@@ -22,122 +34,284 @@ class SimpleVideoGenerator:
         self.client = RunwayML(api_key=self.runway_key)
         self.input_folder = Path(input_prompt_folder)
         self.output_folder = Path(output_video_folder)
+        self.max_concurrent_tasks = 8
+        self.num_submitters = 2
+        self.num_downloaders = 4
+        self.poll_backoff = (2, 4, 8, 16)
+        self.poll_timeout = 30
+        self.download_timeout = 300
+        self.download_attempts = 3
+        self.force = force
+        self.http = None  # aiohttp session, created inside the event loop
         self.setup_logging()
 
+        self.use_uring = use_uring and URING_AVAILABLE
+        if use_uring and not URING_AVAILABLE:
+            logging.warning("liburing is not available, writing downloads with regular file writes")
+
     def setup_logging(self):
         """Set up logging configuration"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('runway_generator.log'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_queue_logging('runway_generator.log')
 
-    def download_video(self, url: str, output_path: Path) -> bool:
+    async def download_video(self, url: str, output_path: Path) -> bool:
         """
         Download video from URL to specified path.
         """
+        # Download to a temporary name so an interrupted run never leaves a
+        # partial video that a rerun would mistake for a finished one
+        part_path = output_path.with_name(output_path.name + '.part')
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            with open(output_path, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
+            async with timeout(self.download_timeout), self.http.get(url) as response:
+                response.raise_for_status()
+                
+                # Plain buffered writes are cheaper than dispatching each chunk
+                # to a thread; only the network side needs to be async
+                file = None
+                if self.use_uring:
+                    try:
+                        file = UringFileWriter(part_path)
+                    except Exception as e:
+                        # io_uring may be blocked (seccomp, io_uring_disabled)
+                        # even when liburing imports, so stop trying it
+                        logging.warning(f"io_uring unavailable, using regular file writes: {str(e)}")
+                        self.use_uring = False
+                if file is None:
+                    file = open(part_path, 'wb', buffering=1 << 20)
+                with file:
+                    async for chunk in response.content.iter_chunked(64 * 1024):
                         file.write(chunk)
-                        
+
+            part_path.replace(output_path)
             logging.info(f"Successfully downloaded video to {output_path}")
             return True
             
+        except asyncio.TimeoutError:
+            logging.error(f"Timed out downloading video to {output_path}")
         except Exception as e:
             logging.error(f"Error downloading video: {str(e)}")
-            return False
+
+        # Don't leave a partial video behind
+        part_path.unlink(missing_ok=True)
+        return False
         
-    def generate_video(self, prompt_path: Path):
+    async def get_prompt_image(self, image_path: Path) -> str:
         """
-        Generate a video from a single prompt file.
+        Get the prompt image reference to send to Runway.
+        
+        Uploads the image when the SDK supports uploads, falling back to an
+        inline base64 data URL.
         
         Args:
-            prompt_path (Path): Path to the prompt file
-        """
-        try:
-            # Read prompt
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-
-            # Find corresponding image
-            image_name = prompt_path.stem.replace('_prompt', '')
-            image_path = self.input_folder.parent / 'input-photos' / f"{image_name}.jpg"
+            image_path (Path): Path to the image file
             
-            if not image_path.exists():
-                logging.error(f"Could not find image for {prompt_path}")
-                return
+        Returns:
+            str: Upload URI or data URL for the image
+        """
+        uploads = getattr(self.client, 'uploads', None)
+        if uploads is not None and hasattr(uploads, 'create_ephemeral'):
+            try:
+                with open(image_path, 'rb') as image_file:
+                    upload = await asyncio.to_thread(uploads.create_ephemeral, file=image_file)
+                return upload.uri
+            except Exception as e:
+                logging.warning(f"Upload failed for {image_path}, sending inline: {str(e)}")
 
-            # Create the generation task
-            logging.info(f"Creating video generation task for {image_name}")
+        return await asyncio.to_thread(image_data_url_cached, image_path)
 
+    async def wait_for_task(self, task_id: str):
+        """
+        Wait for a Runway task to finish.
+        
+        The Runway API offers no webhook or server-side long-poll for task
+        status, so poll with an exponential backoff instead.
+        
+        Args:
+            task_id (str): ID of the Runway task
             
-            # Convert image to base64 string
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-
-            task = self.client.image_to_video.create(
-                model='gen3a_turbo',
-                prompt_image=f"data:image/png;base64,{base64_image}",
-                prompt_text=prompt
-            )
-
-            task_id = task.id
-            time.sleep(10)
-            task = self.client.tasks.retrieve(task_id)
-
-            # Poll for completion
-            logging.info(f"Waiting for task {task.id} to complete")
-            while task.status not in ['SUCCEEDED', 'FAILED']:
-                time.sleep(10)  # Wait for 10 seconds before polling
-                task = self.client.tasks.retrieve(task.id)
+        Returns:
+            The finished task
+        """
+        # Poll for completion
+        logging.info(f"Waiting for task {task_id} to complete")
+        attempt = 0
+        while True:
+            try:
+                async with timeout(self.poll_timeout):
+                    task = await asyncio.to_thread(self.client.tasks.retrieve, task_id)
                 logging.info(f"Task status: {task.status}")
+                if task.status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+                    return task
+            except asyncio.TimeoutError:
+                logging.warning(f"Timed out polling task {task_id}, retrying")
+
+            # Back off exponentially so short jobs are picked up quickly
+            delay = self.poll_backoff[min(attempt, len(self.poll_backoff) - 1)]
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def submit_videos(self, submit_queue: asyncio.Queue, poll_queue: asyncio.Queue, slots: asyncio.Semaphore):
+        """
+        Submit generation tasks to Runway until a None sentinel is received.
+        
+        Args:
+            submit_queue (asyncio.Queue): (prompt_path, image_path) pairs to submit
+            poll_queue (asyncio.Queue): Receives (task_id, image_name) for submitted tasks
+            slots (asyncio.Semaphore): Limits Runway tasks in flight, released by the poller
+        """
+        while (item := await submit_queue.get()) is not None:
+            prompt_path, image_path = item
+            image_name = image_path.stem
+            await slots.acquire()
+            try:
+                # Read prompt
+                prompt = prompt_path.read_text(encoding='utf-8')
+
+                # Create the generation task
+                logging.info(f"Creating video generation task for {image_name}")
+
+                prompt_image = await self.get_prompt_image(image_path)
+
+                # The Runway SDK is synchronous, so run its calls in a worker thread
+                task = await asyncio.to_thread(
+                    self.client.image_to_video.create,
+                    model='gen3a_turbo',
+                    prompt_image=prompt_image,
+                    prompt_text=prompt
+                )
+                await poll_queue.put((task.id, image_name))
+
+            except Exception as e:
+                slots.release()
+                logging.error(f"Error processing {prompt_path}: {str(e)}")
 
-            if task.status == 'SUCCEEDED':
+    async def poll_videos(self, poll_queue: asyncio.Queue, download_queue: asyncio.Queue, slots: asyncio.Semaphore):
+        """
+        Wait for submitted Runway tasks until a None sentinel is received.
+        
+        Args:
+            poll_queue (asyncio.Queue): (task_id, image_name) pairs to wait on
+            download_queue (asyncio.Queue): Receives (video_url, image_name) for finished tasks
+            slots (asyncio.Semaphore): Released once each task has finished
+        """
+        while (item := await poll_queue.get()) is not None:
+            task_id, image_name = item
+            try:
+                task = await self.wait_for_task(task_id)
+
+                if task.status != 'SUCCEEDED':
+                    logging.error(f"Task failed for {image_name}")
                 # Get the video URL from the output
-                if task.output is not None and len(task.output) > 0:
+                elif task.output is not None and len(task.output) > 0:
                     video_url = task.output[0]
                     logging.info(f"Video URL: {video_url}")
-                else:
-                    logging.error(f"No output url for {image_name}")
-                
-                if video_url:
-                    output_path = self.output_folder / f"{image_name}.mp4"
-                    if self.download_video(video_url, output_path):
-                        logging.info(f"Video generation complete for {image_name}")
-                    else:
-                        logging.error(f"Failed to download video for {image_name}")
+                    await download_queue.put((video_url, image_name))
                 else:
                     logging.error(f"No video URL in task output for {image_name}")
-            else:
-                logging.error(f"Task failed for {image_name}")
 
-        except Exception as e:
-            logging.error(f"Error processing {prompt_path}: {str(e)}")
+            except Exception as e:
+                logging.error(f"Error waiting for task {task_id} for {image_name}: {str(e)}")
+            finally:
+                slots.release()
 
-    def process_all_prompts(self):
-        """Process all prompt files and generate videos"""
+    async def download_videos(self, download_queue: asyncio.Queue):
+        """
+        Download finished videos until a None sentinel is received.
+        
+        Args:
+            download_queue (asyncio.Queue): (video_url, image_name) pairs to download
+        """
+        while (item := await download_queue.get()) is not None:
+            video_url, image_name = item
+            output_path = self.output_folder / f"{image_name}.mp4"
+            for attempt in range(1, self.download_attempts + 1):
+                if await self.download_video(video_url, output_path):
+                    logging.info(f"Video generation complete for {image_name}")
+                    break
+                logging.warning(f"Download attempt {attempt} of {self.download_attempts} failed for {image_name}")
+            else:
+                logging.error(f"Failed to download video for {image_name}")
+
+    async def process_all_prompts(self):
+        """
+        Process all prompt files and generate videos.
+        
+        Submitting, polling and downloading run as separate stages connected
+        by queues, so one video can download while others are still being
+        generated or submitted.
+        """
         self.output_folder.mkdir(exist_ok=True)
+        slots = asyncio.Semaphore(self.max_concurrent_tasks)
+        submit_queue = asyncio.Queue()
+        poll_queue = asyncio.Queue()
+        download_queue = asyncio.Queue()
         
-        for prompt_path in self.input_folder.glob('*_prompt.txt'):
-            logging.info(f"Processing {prompt_path.name}")
-            self.generate_video(prompt_path)
+        # Share one pooled session so downloads reuse connections. Downloads
+        # arrive minutes apart, so keep idle connections around long enough
+        # to skip a fresh TLS handshake per video.
+        connector = aiohttp.TCPConnector(limit=16, keepalive_timeout=120)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as self.http:
+            # Pair prompts with images from a single scan of each folder
+            image_folder = self.input_folder.parent / 'input-photos'
+            images = {
+                entry.name[:-len('.jpg')]: Path(entry.path)
+                for entry in os.scandir(image_folder)
+                if entry.name.endswith('.jpg')
+            }
+
+            for prompt_entry in os.scandir(self.input_folder):
+                if not prompt_entry.name.endswith('_prompt.txt'):
+                    continue
+                prompt_path = Path(prompt_entry.path)
+                image_path = images.get(prompt_entry.name[:-len('_prompt.txt')])
+                if image_path is None:
+                    logging.error(f"Could not find image for {prompt_path}")
+                    continue
+
+                output_path = self.output_folder / f"{image_path.stem}.mp4"
+                if not self.force and output_path.exists() and output_path.stat().st_size > 0:
+                    logging.info(f"Skip {image_path.stem}: already generated")
+                    continue
+
+                logging.info(f"Processing {prompt_path.name}")
+                submit_queue.put_nowait((prompt_path, image_path))
+
+            submitters = [
+                asyncio.create_task(self.submit_videos(submit_queue, poll_queue, slots))
+                for _ in range(self.num_submitters)
+            ]
+            pollers = [
+                asyncio.create_task(self.poll_videos(poll_queue, download_queue, slots))
+                for _ in range(self.max_concurrent_tasks)
+            ]
+            downloaders = [
+                asyncio.create_task(self.download_videos(download_queue))
+                for _ in range(self.num_downloaders)
+            ]
+
+            # Shut each stage down once the stage feeding it has drained
+            for stage_queue, workers in [
+                (submit_queue, submitters),
+                (poll_queue, pollers),
+                (download_queue, downloaders),
+            ]:
+                for _ in workers:
+                    stage_queue.put_nowait(None)
+                await asyncio.gather(*workers)
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate Runway videos from prompts and photos")
+    parser.add_argument('--force', action='store_true', help="Regenerate videos that already exist")
+    parser.add_argument('--use-uring', action='store_true', help="Write downloads through io_uring (Linux, needs liburing)")
+    args = parser.parse_args()
+
     # Specify your folder paths
     input_prompt_folder = "prompts"
     output_video_folder = "videos"
     
     try:
-        generator = SimpleVideoGenerator(input_prompt_folder, output_video_folder)
-        generator.process_all_prompts()
+        generator = SimpleVideoGenerator(input_prompt_folder, output_video_folder, use_uring=args.use_uring, force=args.force)
+        asyncio.run(generator.process_all_prompts())
     except Exception as e:
         logging.error(f"Error in main: {str(e)}")
 
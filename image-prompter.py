@@ -1,11 +1,29 @@
 import os
 from pathlib import Path
-from openai import OpenAI
-import base64
+import asyncio
+import hashlib
+import re
+from openai import AsyncOpenAI
 from PIL import Image
 import json
 from datetime import datetime
 import logging
+from log_setup import setup_queue_logging
+from image_cache import atomic_write_path, cache_key, image_data_url_cached
+
+SYSTEM_PROMPT = """You are an expert at analyzing film photos and creating prompts for Runway AI to generate subtle, aesthetic videos. 
+                        Format your response as a detailed prompt that maintains the film aesthetic while adding gentle motion.
+                        Include specifications for: frame rate (24fps), motion elements, static elements, style preservation (film grain, color temperature),
+                        composition requirements, and loop duration (5 seconds). Focus on subtle, natural movements. Please format the output as a simple text 
+                        paragraph in less than 512 characters."""
+
+RESIZED_CACHE_DIR = Path('.cache') / 'resized'
+
+# Separates the per-photo prompts in a batched response
+PROMPT_DELIMITER = "---"
+
+# Label that starts each prompt in a batched response, allowing markdown bold
+PHOTO_LABEL = re.compile(r"\**\s*Photo (\d+)\s*\**\s*:\**\s*(.*)", re.DOTALL)
 
 class PhotoPromptGenerator:
     def __init__(self, api_key, input_folder, output_folder):
@@ -17,36 +35,59 @@ class PhotoPromptGenerator:
             input_folder (str): Path to folder containing photos
             output_folder (str): Path to save generated prompts
         """
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
         self.input_folder = Path(input_folder)
         self.output_folder = Path(output_folder)
+        self.max_concurrent_requests = 10
+        self.batch_size = 8
+        self.max_image_size = 1024
         self.setup_logging()
         
     def setup_logging(self):
         """Set up logging configuration"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('prompt_generator.log'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_queue_logging('prompt_generator.log')
         
+    def resize_image(self, image_path):
+        """
+        Downscale image so its long side fits max_image_size, since GPT-4o
+        downsamples large images anyway. Resized copies are cached on disk.
+        
+        Args:
+            image_path (Path): Path to image file
+            
+        Returns:
+            Path: Path to the resized JPEG, or the original if already small enough
+        """
+        resized_path = RESIZED_CACHE_DIR / f"{cache_key(image_path)}.jpg"
+        if resized_path.exists():
+            return resized_path
+
+        try:
+            with Image.open(image_path) as image:
+                if max(image.size) <= self.max_image_size:
+                    return image_path
+                image.thumbnail((self.max_image_size, self.max_image_size), Image.LANCZOS)
+                with atomic_write_path(resized_path) as temp_path:
+                    image.convert('RGB').save(temp_path, 'JPEG', quality=85)
+        except Exception as e:
+            # Send the photo as-is rather than losing it
+            logging.warning(f"Could not resize {image_path}, sending original: {str(e)}")
+            return image_path
+        return resized_path
+
     def encode_image(self, image_path):
         """
-        Encode image to base64 string.
+        Encode image to a base64 data URL.
         
         Args:
             image_path (Path): Path to image file
             
         Returns:
-            str: Base64 encoded image
+            str: Base64 data URL for the image
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return image_data_url_cached(self.resize_image(image_path))
 
-    def get_image_prompt(self, image_path):
+    async def get_image_prompt(self, image_path):
         """
         Generate prompt for image using GPT-4 Vision.
         
@@ -56,19 +97,16 @@ class PhotoPromptGenerator:
         Returns:
             str: Generated Runway prompt
         """
-        base64_image = self.encode_image(image_path)
-        
         try:
-            response = self.client.chat.completions.create(
+            # Decoding and resizing is CPU work, keep it off the event loop
+            image_url = await asyncio.to_thread(self.encode_image, image_path)
+
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {
                         "role": "system",
-                        "content": """You are an expert at analyzing film photos and creating prompts for Runway AI to generate subtle, aesthetic videos. 
-                        Format your response as a detailed prompt that maintains the film aesthetic while adding gentle motion.
-                        Include specifications for: frame rate (24fps), motion elements, static elements, style preservation (film grain, color temperature),
-                        composition requirements, and loop duration (5 seconds). Focus on subtle, natural movements. Please format the output as a simple text 
-                        paragraph in less than 512 characters."""
+                        "content": SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -76,7 +114,7 @@ class PhotoPromptGenerator:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": image_url
                                 }
                             },
                             {
@@ -94,6 +132,119 @@ class PhotoPromptGenerator:
             logging.error(f"Error generating prompt for {image_path}: {str(e)}")
             return None
 
+    async def get_batch_prompts(self, image_paths):
+        """
+        Generate prompts for several images in a single GPT-4 Vision request,
+        sharing one copy of the system message across all of them.
+        
+        Args:
+            image_paths (list[Path]): Paths to image files
+            
+        Returns:
+            list[str]: Generated Runway prompts, in the same order as image_paths
+        """
+        if len(image_paths) == 1:
+            return [await self.get_image_prompt(image_paths[0])]
+
+        try:
+            # Decoding and resizing is CPU work, keep it off the event loop
+            image_urls = await asyncio.gather(
+                *(asyncio.to_thread(self.encode_image, image_path) for image_path in image_paths)
+            )
+        except Exception as e:
+            logging.error(f"Error encoding batch images, retrying individually: {str(e)}")
+            return [await self.get_image_prompt(image_path) for image_path in image_paths]
+
+        content = []
+        for index, image_url in enumerate(image_urls, start=1):
+            content.append({"type": "text", "text": f"Photo {index}:"})
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": image_url
+                }
+            })
+        content.append({
+            "type": "text",
+            "text": f"Create a Runway AI prompt for each of these {len(image_paths)} film photos that will create a subtle, "
+                    "living cinemagraph while maintaining the original film aesthetic. Start each prompt with its photo's "
+                    f"label (for example \"Photo 1:\"), put a line containing only {PROMPT_DELIMITER} between prompts, "
+                    "and add no other text."
+        })
+
+        try:
+            response = await self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": content
+                    }
+                ],
+                max_tokens=500 * len(image_paths)
+            )
+            text = response.choices[0].message.content
+
+            # Match prompts to photos by their labels, not by position, so a
+            # reordered reply never caches one photo's prompt under another
+            prompts = {}
+            ambiguous = set()
+            for part in re.split(rf"^\s*{re.escape(PROMPT_DELIMITER)}\s*$", text, flags=re.MULTILINE):
+                match = PHOTO_LABEL.match(part.strip())
+                if match is None or not match.group(2).strip():
+                    continue
+                index = int(match.group(1))
+                if index in prompts:
+                    ambiguous.add(index)
+                prompts[index] = match.group(2).strip()
+            for index in ambiguous:
+                del prompts[index]
+
+            # Only photos whose label was missing or repeated need another request
+            results = []
+            for index, image_path in enumerate(image_paths, start=1):
+                if index not in prompts:
+                    logging.warning(f"No labelled prompt for {image_path.name} in batch reply, retrying individually")
+                    prompts[index] = await self.get_image_prompt(image_path)
+                results.append(prompts[index])
+            return results
+
+        except Exception as e:
+            logging.error(f"Error generating batch prompts: {str(e)}")
+
+        return [await self.get_image_prompt(image_path) for image_path in image_paths]
+
+    def prompt_cache_file(self, image_path):
+        """
+        Get the cache file for an image's prompt, keyed by image content.
+        
+        Args:
+            image_path (Path): Path to image file
+            
+        Returns:
+            Path: Location of the cached prompt
+        """
+        key = hashlib.blake2b(image_path.read_bytes(), digest_size=16).hexdigest()
+        return self.output_folder / '.cache' / f"{key}.txt"
+
+    def cache_prompt(self, cache_file, image_name, prompt):
+        """
+        Store a newly generated prompt in the cache and save it to the
+        output folder.
+        
+        Args:
+            cache_file (Path): Cache location for the image's prompt
+            image_name (str): Original image filename
+            prompt (str): Generated prompt
+        """
+        with atomic_write_path(cache_file) as temp_file:
+            temp_file.write_text(prompt, encoding='utf-8')
+        self.save_prompt(image_name, prompt)
+
     def save_prompt(self, image_name, prompt):
         """
         Save generated prompt to output folder.
@@ -104,25 +255,49 @@ class PhotoPromptGenerator:
         """
         output_file = self.output_folder / f"{image_name}_prompt.txt"
         try:
-            with open(output_file, 'w') as f:
-                f.write(prompt)
+            output_file.write_text(prompt, encoding='utf-8')
             logging.info(f"Saved prompt for {image_name}")
         except Exception as e:
             logging.error(f"Error saving prompt for {image_name}: {str(e)}")
 
-    def process_photos(self):
-        """Process all photos in input folder and generate prompts"""
+    async def process_photos(self):
+        """Process all photos in input folder and generate prompts concurrently"""
         self.output_folder.mkdir(exist_ok=True)
         
         image_extensions = {'.jpg', '.jpeg', '.png'}
-        
-        for image_path in self.input_folder.iterdir():
-            if image_path.suffix.lower() in image_extensions:
-                logging.info(f"Processing {image_path.name}")
-                
-                prompt = self.get_image_prompt(image_path)
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def process_batch(batch):
+            async with semaphore:
+                logging.info(f"Processing {', '.join(image_path.name for image_path, _ in batch)}")
+                prompts = await self.get_batch_prompts([image_path for image_path, _ in batch])
+
+            for (image_path, cache_file), prompt in zip(batch, prompts):
                 if prompt:
-                    self.save_prompt(image_path.stem, prompt)
+                    await asyncio.to_thread(self.cache_prompt, cache_file, image_path.stem, prompt)
+
+        # Skip the model call for photos we have already prompted
+        image_paths = [
+            image_path for image_path in self.input_folder.iterdir()
+            if image_path.suffix.lower() in image_extensions
+        ]
+        cache_files = await asyncio.gather(
+            *(asyncio.to_thread(self.prompt_cache_file, image_path) for image_path in image_paths)
+        )
+        uncached = []
+        for image_path, cache_file in zip(image_paths, cache_files):
+            if cache_file.exists():
+                logging.info(f"Using cached prompt for {image_path.name}")
+                prompt = await asyncio.to_thread(cache_file.read_text, encoding='utf-8')
+                await asyncio.to_thread(self.save_prompt, image_path.stem, prompt)
+            else:
+                uncached.append((image_path, cache_file))
+
+        batches = [
+            uncached[start:start + self.batch_size]
+            for start in range(0, len(uncached), self.batch_size)
+        ]
+        await asyncio.gather(*(process_batch(batch) for batch in batches))
 
 def main():
     # Replace with your actual API key and folder paths
@@ -131,7 +306,7 @@ def main():
     output_folder = "prompts"
     
     generator = PhotoPromptGenerator(api_key, input_folder, output_folder)
-    generator.process_photos()
+    asyncio.run(generator.process_photos())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
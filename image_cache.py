@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import mimetypes
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+CACHE_DIR = Path('.cache') / 'base64'
+
+# Encode large files in slices; a multiple of 3 keeps slices padding-free
+ENCODE_BLOCK_SIZE = 3 * 65536
+
+
+def cache_key(image_path):
+    """
+    Build a cache key from the image's path, size and modification time.
+    
+    Args:
+        image_path (Path): Path to image file
+        
+    Returns:
+        str: Hex digest identifying this version of the image
+    """
+    stat = image_path.stat()
+    key = f"{image_path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def atomic_write_path(path):
+    """
+    Provide a temporary file next to path that replaces path only once the
+    block completes, so an interrupted write never leaves a truncated file
+    that looks like a valid cache entry.
+    
+    Args:
+        path (Path): Final location of the file
+        
+    Yields:
+        Path: Temporary file to write to
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.part')
+    os.close(fd)
+    temp_path = Path(temp_name)
+    try:
+        yield temp_path
+        temp_path.replace(path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def _encode_file(image_path, prefix=b''):
+    """
+    Base64 encode a file through a memory map into a single buffer,
+    avoiding full in-memory copies of the raw bytes and of the result.
+    
+    Args:
+        image_path (Path): Path to image file
+        prefix (bytes): ASCII bytes to place before the encoded contents
+        
+    Returns:
+        str: prefix followed by the base64 encoded file contents
+    """
+    encoded = bytearray(prefix)
+    with open(image_path, 'rb') as f:
+        if image_path.stat().st_size == 0:
+            return encoded.decode('ascii')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) <= ENCODE_BLOCK_SIZE:
+                encoded += base64.b64encode(mm)
+            else:
+                for start in range(0, len(mm), ENCODE_BLOCK_SIZE):
+                    encoded += base64.b64encode(mm[start:start + ENCODE_BLOCK_SIZE])
+    return encoded.decode('ascii')
+
+
+def image_data_url_cached(image_path, cache_dir=CACHE_DIR):
+    """
+    Encode image as a base64 data URL, reusing a cached encoding when the
+    image has not changed since the last run.
+    
+    Args:
+        image_path (Path): Path to image file
+        cache_dir (Path): Folder holding cached encodings
+        
+    Returns:
+        str: data URL for the image
+    """
+    image_path = Path(image_path)
+    cache_file = Path(cache_dir) / f"{cache_key(image_path)}.url"
+    if cache_file.exists():
+        return cache_file.read_text(encoding='ascii')
+
+    # Build the data URL in place rather than concatenating afterwards
+    prefix = f"data:{image_mime_type(image_path)};base64,".encode('ascii')
+    data_url = _encode_file(image_path, prefix)
+    with atomic_write_path(cache_file) as temp_file:
+        temp_file.write_text(data_url, encoding='ascii')
+    return data_url
+
+
+def image_mime_type(image_path):
+    """
+    Guess the MIME type of an image from its file suffix.
+    
+    Args:
+        image_path (Path): Path to image file
+        
+    Returns:
+        str: MIME type, defaulting to image/jpeg
+    """
+    mime_type, _ = mimetypes.guess_type(str(image_path))
+    return mime_type or 'image/jpeg'
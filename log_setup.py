@@ -0,0 +1,35 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+
+def setup_queue_logging(log_file):
+    """
+    Set up logging to a file and the console.
+    
+    Records are handed to a background thread through a queue so logging
+    calls from coroutines never block the event loop on file writes. Does
+    nothing if the root logger already has handlers.
+    
+    Args:
+        log_file (str): Path of the log file
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler(log_file),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
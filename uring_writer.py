@@ -0,0 +1,89 @@
+import os
+
+try:
+    from liburing import (
+        Cqe, Ring, io_uring_cqe_seen, io_uring_get_sqe, io_uring_prep_write,
+        io_uring_queue_exit, io_uring_queue_init, io_uring_submit,
+        io_uring_wait_cqe, trap_error,
+    )
+    URING_AVAILABLE = True
+except ImportError:
+    URING_AVAILABLE = False
+
+# Number of chunk writes queued before submitting them to the ring
+BATCH_SIZE = 8
+
+
+class UringFileWriter:
+    """
+    Write a file sequentially through io_uring, submitting chunk writes in
+    batches so each batch costs one syscall instead of one per chunk.
+    
+    Requires Linux and the optional liburing package; check
+    URING_AVAILABLE before using it.
+    """
+
+    def __init__(self, output_path):
+        """
+        Open the output file and set up the ring.
+        
+        Args:
+            output_path (Path): Path of the file to write
+        """
+        # Set up the ring first so a kernel without io_uring fails before
+        # the file is opened
+        self.ring = Ring()
+        self.cqe = Cqe()
+        self.offset = 0
+        self.pending = []  # Chunks must stay alive until their write completes
+        io_uring_queue_init(BATCH_SIZE, self.ring)
+        try:
+            self.fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        except BaseException:
+            io_uring_queue_exit(self.ring)
+            raise
+
+    def write(self, chunk: bytes):
+        """
+        Queue a chunk to be written after everything already queued.
+        
+        Args:
+            chunk (bytes): Data to append to the file
+        """
+        sqe = io_uring_get_sqe(self.ring)
+        io_uring_prep_write(sqe, self.fd, chunk, self.offset)
+        self.offset += len(chunk)
+        self.pending.append(chunk)
+        if len(self.pending) == BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Submit queued writes and wait for all of them to complete"""
+        if not self.pending:
+            return
+        io_uring_submit(self.ring)
+        # Completions may arrive out of order, so check the batch as a whole
+        written = 0
+        for _ in self.pending:
+            trap_error(io_uring_wait_cqe(self.ring, self.cqe))
+            entry = self.cqe[0]
+            written += trap_error(entry.res)
+            io_uring_cqe_seen(self.ring, entry)
+        expected = sum(len(chunk) for chunk in self.pending)
+        self.pending.clear()
+        if written != expected:
+            raise OSError(f"Short write: {written} of {expected} bytes")
+
+    def close(self):
+        """Flush outstanding writes and release the ring and file"""
+        try:
+            self.flush()
+        finally:
+            io_uring_queue_exit(self.ring)
+            os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()